@@ -1,10 +1,15 @@
+import os
+import tempfile
 import streamlit as st
 import requests
 import pandas as pd
+import numpy as np
 import plotly.express as px
-from datetime import datetime
-import seaborn as sns
+import plotly.io as pio
+from datetime import datetime, timedelta
+from functools import reduce
 import matplotlib.pyplot as plt
+from matplotlib.patches import Patch
 
 # NASA POWER API Base URL
 BASE_URL = "https://power.larc.nasa.gov/api/temporal/daily/point"
@@ -22,7 +27,8 @@ hide_bar = """
 """
 st.markdown(hide_bar, unsafe_allow_html=True)
 
-# Function to fetch climate data
+# Function to fetch climate data (cached for a day, NASA POWER refreshes daily at best)
+@st.cache_data(ttl=60 * 60 * 24)
 def fetch_nasa_data(lat, lon, start, end, parameters):
     params = {
         "parameters": ",".join(parameters),
@@ -46,24 +52,112 @@ def fetch_nasa_data(lat, lon, start, end, parameters):
     result = {}
     for param in parameters:
         if param in data["properties"]["parameter"]:
-            df = pd.DataFrame(
-                data["properties"]["parameter"][param].items(), 
-                columns=["Date", param]
-            )
+            # Build the columns as arrays first instead of unpacking (date, value) tuples
+            values = data["properties"]["parameter"][param]
+            df = pd.DataFrame({
+                "Date": list(values.keys()),
+                param: np.fromiter(values.values(), dtype=np.float64, count=len(values))
+            }, copy=False)
             result[param] = df
         else:
             st.warning(f"Parameter '{param}' is not available for the given location and time range.")
     
     return result
 
+# Directory for the parquet climate cache: RMDA_CACHE_DIR if set, otherwise next to app.py,
+# falling back to the system temp directory when that location isn't writable
+def climate_cache_dir():
+    cache_dir = os.environ.get("RMDA_CACHE_DIR") or os.path.dirname(os.path.abspath(__file__))
+    if not os.access(cache_dir, os.W_OK):
+        cache_dir = tempfile.gettempdir()
+    return cache_dir
+
+# Load climate data from a local parquet copy, calling the API only for dates past its end.
+# Past NASA POWER dates don't change, so the parquet file is extended rather than re-fetched.
+@st.cache_data(ttl=60 * 60 * 24)
+def load_climate_data(lat, lon, start, end, parameters):
+    cache_dir = climate_cache_dir()
+    cache_file = os.path.join(cache_dir, f"nasa_power_{lat}_{lon}.parquet")
+    cached = None
+    if os.path.exists(cache_file):
+        try:
+            cached = pd.read_parquet(cache_file)
+        except (OSError, ValueError):
+            cached = None  # Unreadable (e.g. truncated) cache file, re-fetch from the API
+    if cached is not None:
+        if not {"Date", *parameters}.issubset(cached.columns) or cached["Date"].min() > start:
+            cached = None
+
+    fetch_start = start
+    if cached is not None:
+        last_date = datetime.strptime(cached["Date"].max(), "%Y%m%d")
+        fetch_start = (last_date + timedelta(days=1)).strftime("%Y%m%d")
+
+    if fetch_start <= end:
+        climate_data = fetch_nasa_data(lat, lon, fetch_start, end, parameters)
+        # Merge climate data on the shared Date key
+        fetched = reduce(lambda l, r: l.merge(r, on="Date", how="outer"), climate_data.values())
+        cached = fetched if cached is None else pd.concat([cached, fetched], ignore_index=True)
+        # Write to a temp file and move it into place so readers never see a partial file
+        tmp_file = None
+        try:
+            fd, tmp_file = tempfile.mkstemp(dir=cache_dir, suffix=".tmp.parquet")
+            os.close(fd)
+            cached.to_parquet(tmp_file, index=False)
+            os.replace(tmp_file, cache_file)
+        except (OSError, ValueError):
+            # The parquet cache is optional: drop any partial temp file and keep the in-memory data
+            if tmp_file is not None and os.path.exists(tmp_file):
+                try:
+                    os.remove(tmp_file)
+                except OSError:
+                    pass
+
+    # Dates are YYYYMMDD strings, so string comparison orders them correctly
+    in_range = (cached["Date"] >= start) & (cached["Date"] <= end)
+    columns = [col for col in ("Date", *parameters) if col in cached.columns]
+    return cached.loc[in_range, columns].reset_index(drop=True)
+
 # Process data for monthly trends
+@st.cache_data
 def process_monthly_data(data):
-    data["Date"] = pd.to_datetime(data["Date"])
-    data["Year"] = data["Date"].dt.year
-    data["Month"] = data["Date"].dt.month
-    monthly_avg = data.groupby(["Year", "Month"]).mean().reset_index()
+    # The caller usually converts Date already; only parse when it is still a string column
+    if not pd.api.types.is_datetime64_any_dtype(data["Date"]):
+        data["Date"] = pd.to_datetime(data["Date"], format="%Y%m%d", cache=True)
+    # Months since the epoch; offset from the first month gives a dense integer group id
+    months = data["Date"].to_numpy().astype("datetime64[M]").astype(np.int64)
+    gid = months - months.min()
+    present = np.bincount(gid) > 0
+    month_index = np.flatnonzero(present) + months.min()
+    monthly_avg = pd.DataFrame({"Year": month_index // 12 + 1970, "Month": month_index % 12 + 1})
+
+    # Mean per month of each climate parameter column (NaNs skipped, like groupby().mean())
+    value_columns = [col for col in data.columns if col != "Date"]
+    for col in value_columns:
+        values = data[col].to_numpy(dtype=np.float64)
+        valid = ~np.isnan(values)
+        sums = np.bincount(gid[valid], weights=values[valid], minlength=len(present))
+        counts = np.bincount(gid[valid], minlength=len(present))
+        with np.errstate(invalid="ignore"):
+            monthly_avg[col] = (sums / counts)[present]
     return monthly_avg
 
+# Display names for the monthly trend metrics
+metric_labels = {"T2M": "Temperature (°C)", "PRECTOTCORR": "Rainfall (mm)", "Dengue Cases": "Dengue Cases"}
+
+# Build one per-Year monthly line chart with a facet row per metric and cache its JSON,
+# so reruns skip the px.line construction
+@st.cache_data
+def monthly_trends_json(df, metrics):
+    long_df = df.melt(id_vars=["Year", "Month"], value_vars=list(metrics), var_name="Metric", value_name="Value")
+    fig = px.line(long_df, x="Month", y="Value", color="Year", facet_row="Metric", render_mode="webgl",
+                  title="Monthly Temperature, Rainfall, and Dengue Case Trends",
+                  labels={"Month": "Month", "Year": "Year", "Value": ""},
+                  height=300 * len(metrics))
+    fig.update_yaxes(matches=None)  # Each metric keeps its own y scale
+    fig.for_each_annotation(lambda a: a.update(text=metric_labels[a.text.split("=", 1)[-1]]))
+    return fig.to_json()
+
 # Dengue case data
 dengue_data = {
     "Year": [2013, 2014, 2015, 2016, 2017, 2018, 2019, 2020, 2021, 2022, 2023],
@@ -82,16 +176,26 @@ dengue_data = {
     "Total": [861, 1456, 3917, 3307, 651, 717, 11942, 38, 3526, 5039, 2738]
 }
 
-# Convert dengue cases to DataFrame
-dengue_df = pd.DataFrame(dengue_data)
-dengue_df = pd.melt(dengue_df, id_vars=["Year"], var_name="Month", value_name="Dengue Cases")
-
 # Convert month names to numbers
 month_mapping = {
     "Jan": 1, "Feb": 2, "Mar": 3, "Apr": 4, "May": 5, "Jun": 6,
     "Jul": 7, "Aug": 8, "Sep": 9, "Oct": 10, "Nov": 11, "Dec": 12
 }
-dengue_df["Month"] = dengue_df["Month"].map(month_mapping)
+# Month names indexed by month number - 1 (final_df already carries integer Year/Month columns)
+month_names = np.array(list(month_mapping))
+
+# Convert dengue cases to a long (Year, Month, Dengue Cases) DataFrame
+@st.cache_data
+def build_dengue_df(data):
+    # Columns are ordered Jan..Dec, so build the long form directly (one row per year-month)
+    n_years = len(data["Year"])
+    return pd.DataFrame({
+        "Year": np.repeat(data["Year"], 12),
+        "Month": np.tile(list(month_mapping.values()), n_years),
+        "Dengue Cases": np.column_stack([data[m] for m in month_mapping]).ravel()
+    })
+
+dengue_df = build_dengue_df(dengue_data)
 
 # Streamlit App
 st.title("Climate Impact on Dengue Cases and Mosquito Population Growth Trends in Rawalpindi, Pakistan")
@@ -103,21 +207,15 @@ end_date =  "20231201"
 lat, lon = 33.6, 73.0  # Central coordinates for Rawalpindi
 
 # Parameters for the analysis
-parameters = ["T2M", "PRECTOTCORR"]  # Temperature & corrected precipitation
+parameters = ("T2M", "PRECTOTCORR")  # Temperature & corrected precipitation
 
 # Fetch and process data
-st.info("Fetching climate data from NASA POWER API...")
+st.info("Loading climate data from NASA POWER API (read from the local cache when available)...")
 try:
-    climate_data = fetch_nasa_data(lat, lon, start_date, end_date, parameters)
+    combined_data = load_climate_data(lat, lon, start_date, end_date, parameters)
     
-    # Merge climate data
-    all_data = []
-    for param, df in climate_data.items():
-        all_data.append(df)
-    combined_data = pd.concat(all_data, axis=1).loc[:, ~pd.concat(all_data, axis=1).columns.duplicated()]
-    
-    # Convert dates and compute monthly trends
-    combined_data["Date"] = pd.to_datetime(combined_data["Date"])
+    # Convert NASA YYYYMMDD date strings (explicit format skips per-element inference) and compute monthly trends
+    combined_data["Date"] = pd.to_datetime(combined_data["Date"], format="%Y%m%d", cache=True)
     monthly_data = process_monthly_data(combined_data)
 
     # Merge dengue data
@@ -126,28 +224,10 @@ try:
     # Display visual trends
     st.subheader("Monthly Trends of Temperature, Rainfall, and Dengue Cases")
     
-    monthly_data = monthly_data[monthly_data["T2M"] >= -5]
-    monthly_data = monthly_data[monthly_data["PRECTOTCORR"] >= 0]
-    
-    # Temperature vs Dengue Cases per Month
-    if "T2M" in final_df:
-        fig = px.line(final_df, x="Month", y="T2M", color="Year", 
-                      title="Monthly Temperature Trends (°C)", 
-                      labels={"T2M": "Temperature (°C)", "Month": "Month", "Year": "Year"})
-        st.plotly_chart(fig)
-
-    # Rainfall vs Dengue Cases per Month
-    if "PRECTOTCORR" in final_df:
-        fig = px.line(final_df, x="Month", y="PRECTOTCORR", color="Year", 
-                      title="Monthly Rainfall Trends (mm)", 
-                      labels={"PRECTOTCORR": "Rainfall (mm)", "Month": "Month", "Year": "Year"})
-        st.plotly_chart(fig)
-
-    # Dengue Cases per Month
-    fig = px.line(final_df, x="Month", y="Dengue Cases", color="Year", 
-                  title="Monthly Dengue Cases", 
-                  labels={"Dengue Cases": "Dengue Cases", "Month": "Month", "Year": "Year"})
-    st.plotly_chart(fig)
+    # Temperature, rainfall and dengue cases per month as facet rows of one chart
+    metrics = tuple(col for col in ("T2M", "PRECTOTCORR", "Dengue Cases") if col in final_df)
+    fig = pio.from_json(monthly_trends_json(final_df, metrics))
+    st.plotly_chart(fig, width="stretch")
 
     # Yearly Overview of Dengue Cases, Temperature, and Rainfall
     st.subheader("Yearly Overview")
@@ -169,12 +249,24 @@ try:
 
     # Display the table in Streamlit
     st.title('Dengue Cases Over the Years')
-    st.table(df)
+    st.dataframe(df, width="stretch", hide_index=True)
     
 
 except Exception as e:
     st.error(f"Error fetching data: {e}")
 
+# Add a least-squares trendline fitted with numpy (skips Plotly Express' statsmodels OLS path)
+def add_ols_trendline(fig, df, x, y):
+    fit_data = df[[x, y]].dropna()
+    slope, intercept = np.polyfit(fit_data[x], fit_data[y], 1)
+    r_squared = np.corrcoef(fit_data[x], fit_data[y])[0, 1] ** 2
+    xs = np.array([fit_data[x].min(), fit_data[x].max()])
+    # Show the fitted equation and R² on hover, as Plotly Express' trendline="ols" did
+    fig.add_scatter(x=xs, y=slope * xs + intercept, mode="lines", name="OLS trendline",
+                    hovertemplate=f"<b>OLS trendline</b><br>y = {slope:.3g}x + {intercept:.3g}<br>"
+                                  f"R<sup>2</sup>={r_squared:.3f}<extra></extra>")
+    return fig
+
 # Function to compute and display correlation with year and month info
 def display_correlation_with_year_month(df):
     # Compute correlation matrix for T2M, PRECTOTCORR, and Dengue Cases
@@ -185,37 +277,27 @@ def display_correlation_with_year_month(df):
     st.subheader("Scatter Plots with Trendlines (Year and Month Info)")
     
     # Temperature vs Dengue Cases
-    fig_temp_dengue = px.scatter(df, x="T2M", y="Dengue Cases", trendline="ols", 
+    fig_temp_dengue = px.scatter(df, x="T2M", y="Dengue Cases", render_mode="webgl",
                                  title="Temperature vs Dengue Cases (Year and Month Info)", 
                                  labels={"T2M": "Temperature (°C)", "Dengue Cases": "Dengue Cases"},
                                  hover_data=["Year", "Month"])
+    add_ols_trendline(fig_temp_dengue, df, "T2M", "Dengue Cases")
     st.plotly_chart(fig_temp_dengue)
 
     # Rainfall vs Dengue Cases
-    fig_rain_dengue = px.scatter(df, x="PRECTOTCORR", y="Dengue Cases", trendline="ols", 
+    fig_rain_dengue = px.scatter(df, x="PRECTOTCORR", y="Dengue Cases", render_mode="webgl",
                                  title="Rainfall vs Dengue Cases (Year and Month Info)", 
                                  labels={"PRECTOTCORR": "Rainfall (mm)", "Dengue Cases": "Dengue Cases"},
                                  hover_data=["Year", "Month"])
+    add_ols_trendline(fig_rain_dengue, df, "PRECTOTCORR", "Dengue Cases")
     st.plotly_chart(fig_rain_dengue)
 
 # Call the new function to display correlation with year and month info
 display_correlation_with_year_month(final_df)
 
 
-# Ensure 'Year' and 'Month' columns are added to the DataFrame
-def add_year_month_column(df):
-    if 'Year' not in df.columns:
-        # Assuming 'Date' column is in YYYY-MM-DD format
-        df['Year'] = pd.to_datetime(df['Date'], errors='coerce').dt.year
-    if 'Month' not in df.columns:
-        df['Month'] = pd.to_datetime(df['Date'], errors='coerce').dt.month_name()  # Month as name (e.g., January)
-    return df
-
 # Function to create a more advanced graphical representation of the correlation
 def advanced_visual_representation(df):
-    # Ensure Year and Month columns are present
-    df = add_year_month_column(df)
-    
     # Update column names to match those in the final dataframe
     temperature_column = "T2M"  # Assuming T2M is the temperature column
     rainfall_column = "PRECTOTCORR"  # Assuming PRECTOTCORR is the rainfall column
@@ -224,7 +306,9 @@ def advanced_visual_representation(df):
     st.subheader("3D Scatter Plot: Temperature, Rainfall, Dengue Cases, and Month")
     fig_3d = px.scatter_3d(df, x=temperature_column, y=rainfall_column, z="Dengue Cases", color="Month", 
                            title="3D Scatter Plot of Temperature, Rainfall, Dengue Cases, and Month",
-                           labels={temperature_column: "Temperature (°C)", rainfall_column: "Rainfall (mm)", "Dengue Cases": "Dengue Cases"})
+                           labels={temperature_column: "Temperature (°C)", rainfall_column: "Rainfall (mm)", "Dengue Cases": "Dengue Cases"},
+                           opacity=0.8)
+    fig_3d.update_traces(marker=dict(size=4))  # Smaller markers keep the WebGL scene light
     
     # Adjust the layout to set the 3D plot's width and height to a larger size
     fig_3d.update_layout(scene=dict(
@@ -236,19 +320,20 @@ def advanced_visual_representation(df):
     )
     
     # Show the plot with container width set to true for better view
-    st.plotly_chart(fig_3d, use_container_width=True)
+    st.plotly_chart(fig_3d, width="stretch")
 
     # Pair plot for Temperature, Rainfall, and Dengue Cases
     st.subheader("Pair Plot: Temperature, Rainfall, and Dengue Cases by Month")
     pair_plot_data = df[[temperature_column, rainfall_column, "Dengue Cases", "Year", "Month"]]
     
-    # Create a pair plot using seaborn
-    sns.set(style="ticks")
-    pair_plot = sns.pairplot(pair_plot_data, kind="scatter", hue="Month", palette="viridis")
-    pair_plot.fig.suptitle("Pair Plot of Temperature, Rainfall, and Dengue Cases by Month", y=1.02)
+    # Create a pair plot as a plotly scatter matrix (splom traces are drawn with WebGL)
+    fig_pair = px.scatter_matrix(pair_plot_data, dimensions=[temperature_column, rainfall_column, "Dengue Cases"],
+                                 color="Month", color_continuous_scale="Viridis",
+                                 title="Pair Plot of Temperature, Rainfall, and Dengue Cases by Month",
+                                 labels={temperature_column: "Temperature (°C)", rainfall_column: "Rainfall (mm)"})
 
     # Display pair plot using Streamlit
-    st.pyplot(pair_plot.fig)
+    st.plotly_chart(fig_pair, width="stretch")
 
 # Call the function to display advanced visualizations
 advanced_visual_representation(final_df)
@@ -257,22 +342,21 @@ advanced_visual_representation(final_df)
 ####################
 
 def clear_heatmap_representation(df):
-    # Ensure Year and Month columns are present
-    df = add_year_month_column(df)
-    
     # Update column names to match those in the final dataframe
     temperature_column = "T2M"  # Assuming T2M is the temperature column
     rainfall_column = "PRECTOTCORR"  # Assuming PRECTOTCORR is the rainfall column
 
     # Group the data by Month to calculate mean Temperature, Rainfall and sum Dengue Cases
-    df_monthly = df.groupby(['Month']).agg(
-        {temperature_column: 'mean', rainfall_column: 'mean', 'Dengue Cases': 'sum'}).reset_index()
+    df_monthly = df.groupby('Month', sort=True, as_index=False).agg(**{
+        temperature_column: (temperature_column, 'mean'),
+        rainfall_column: (rainfall_column, 'mean'),
+        'Dengue Cases': ('Dengue Cases', 'sum')})
     
     # Create a heatmap using Plotly
     fig_heatmap = px.imshow(df_monthly.set_index('Month').T,
                             title="Heatmap - Temperature, Rainfall & Dengue Cases by Month",
                             labels={"color": "Values"},
-                            x=df_monthly['Month'], y=df_monthly.columns[1:], 
+                            x=month_names[df_monthly['Month'].to_numpy() - 1], y=df_monthly.columns[1:], 
                             color_continuous_scale="RdYlGn",  # Better color scale for clarity
                             aspect="auto")
 
@@ -290,7 +374,7 @@ def clear_heatmap_representation(df):
     
     # Show the plot in Streamlit
     st.subheader("Heatmap: Temperature, Rainfall, and Dengue Cases by Month")
-    st.plotly_chart(fig_heatmap, use_container_width=True)
+    st.plotly_chart(fig_heatmap, width="stretch")
 
 # Call the function to display the enhanced heatmap
 clear_heatmap_representation(final_df)
@@ -321,23 +405,25 @@ st.write("""
 """)
 
 # Update mosquito population data to also show in 2024 (based on 2024 larvae site information)
-df["Mosquito Population (Aedes aegypti)"][1] = df["Dengue Larvae Sites Detected (2024)"][1] * 0.46 / 8064 * 3484  # Estimate based on dengue sites
-df["Mosquito Population (Aedes albopictus)"][1] = df["Dengue Larvae Sites Detected (2024)"][1] * 0.54 / 8064 * 3484  # Estimate based on dengue sites
+df.loc[1, "Mosquito Population (Aedes aegypti)"] = df.loc[1, "Dengue Larvae Sites Detected (2024)"] * 0.46 / 8064 * 3484  # Estimate based on dengue sites
+df.loc[1, "Mosquito Population (Aedes albopictus)"] = df.loc[1, "Dengue Larvae Sites Detected (2024)"] * 0.54 / 8064 * 3484  # Estimate based on dengue sites
 
 # Create a bar plot showing mosquito population
 fig, ax = plt.subplots(figsize=(8, 5))
 
-# Bar plot for mosquito population in 2016 and 2024
-ax.bar(df["Year"][:-1], df["Mosquito Population (Aedes aegypti)"][:-1], width=0.4, label="Aedes aegypti (2016)", color="blue", align="center")
-ax.bar(df["Year"][:-1], df["Mosquito Population (Aedes albopictus)"][:-1], width=0.4, label="Aedes albopictus (2016)", color="green", align="edge")
-ax.bar(df["Year"][1:], df["Mosquito Population (Aedes aegypti)"][1:], width=0.4, label="Aedes aegypti (2024)", color="lightblue", align="center")
-ax.bar(df["Year"][1:], df["Mosquito Population (Aedes albopictus)"][1:], width=0.4, label="Aedes albopictus (2024)", color="lightgreen", align="edge")
+# Bar plot for mosquito population in 2016 and 2024, drawn in a single call (aegypti left, albopictus right of each year)
+xs = np.array([2016 - 0.2, 2016 + 0.2, 2024 - 0.2, 2024 + 0.2])
+heights = np.array([df.loc[0, "Mosquito Population (Aedes aegypti)"], df.loc[0, "Mosquito Population (Aedes albopictus)"],
+                    df.loc[1, "Mosquito Population (Aedes aegypti)"], df.loc[1, "Mosquito Population (Aedes albopictus)"]])
+colors = ["blue", "green", "lightblue", "lightgreen"]
+labels = ["Aedes aegypti (2016)", "Aedes albopictus (2016)", "Aedes aegypti (2024)", "Aedes albopictus (2024)"]
+ax.bar(xs, heights, width=0.4, color=colors, align="center")
 
 # Labels and title
 ax.set_xlabel("Year")
 ax.set_ylabel("Population (Number of Mosquitoes)")
 ax.set_title("Mosquito Population Distribution in Rawalpindi (2016 vs 2024)")
-ax.legend()
+ax.legend(handles=[Patch(color=color, label=label) for color, label in zip(colors, labels)])
 
 # Show the plot
 st.pyplot(fig)
@@ -366,9 +452,9 @@ fig2, ax2 = plt.subplots(figsize=(8, 5))
 
 # Bar plot for dengue larvae sites in 2024
 ax2.bar([1, 2, 3], 
-        [df["Dengue Larvae Sites Detected (2024)"][1], 
-         df["Homes with Dengue Larvae (2024)"][1], 
-         df["Outdoor Locations with Dengue Larvae (2024)"][1]], 
+        [df.loc[1, "Dengue Larvae Sites Detected (2024)"], 
+         df.loc[1, "Homes with Dengue Larvae (2024)"], 
+         df.loc[1, "Outdoor Locations with Dengue Larvae (2024)"]], 
         width=0.4, color=["red", "purple", "orange"], align="center")
 
 # Labels and title